@@ -1,56 +1,816 @@
+import asyncio
+import contextlib
+import json
 import os
-import urllib.request
+import shutil
+import stat
+import struct
+import tempfile
+import threading
+import urllib.error
+import urllib.parse
 import zipfile
 import subprocess
 import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import BinaryIO, Callable
+
+import urllib3
+
+try:
+    # Optional: ISA-L inflates ZIP members several times faster than zlib
+    from isal import isal_zlib
+except ImportError:
+    isal_zlib = None
+
+try:
+    # Optional: python3-apt reads and changes the apt cache in-process
+    import apt
+except ImportError:
+    apt = None
+
+# Socket reads are copied to disk 1 MiB at a time.
+_COPY_CHUNK = 1 << 20
+# Archives smaller than this are not worth splitting across connections.
+_PARALLEL_MIN_SIZE = 32 << 20
+# A split archive is fetched as up to 16 Range requests of at least 4 MiB,
+# so that connections which finish early pick up the remaining ones.
+_RANGE_MIN_SIZE = 4 << 20
+_MAX_RANGES = 16
+# Archives that are extracted and then discarded are kept in memory up to this size.
+_SPOOL_MAX_SIZE = 64 << 20
+# Bytes fetched from the end of an archive to reach its central directory.
+_TAIL_SIZE = 1 << 20
+# Download progress prints one dot per chunk and flushes stdout every this many.
+_DOTS_PER_FLUSH = 64
+
+# ZIP members are already deflated, and a transfer encoding would also make
+# byte offsets for Range requests meaningless.
+_HEADERS = {"Accept-Encoding": "identity"}
+
+_pool: urllib3.PoolManager | None = None
+_pool_lock = threading.Lock()
+
+
+def _http() -> urllib3.PoolManager:
+    """
+    Return the module-wide connection pool, creating it on first use so that
+    TCP/TLS connections are reused across downloads.
+
+    Each host keeps up to `_MAX_RANGES` idle connections, enough for every
+    connection of a split download to be reused rather than discarded.
+    Connection errors and transient 5xx answers are retried with backoff.
+    Requests that pass their own headers must start from `_HEADERS`.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = urllib3.PoolManager(
+                maxsize=_MAX_RANGES,
+                headers=_HEADERS,
+                retries=urllib3.Retry(
+                    connect=3, read=3, status=3, redirect=10, backoff_factor=0.3,
+                    status_forcelist=(500, 502, 503, 504)
+                )
+            )
+    return _pool
+
+
+def _write_all(dst: BinaryIO, data: bytes) -> None:
+    """
+    Write `data` to the unbuffered file `dst`, looping over short writes.
+    """
+    view = memoryview(data)
+    while view:
+        view = view[dst.write(view):]
+
+
+class _Progress:
+    """
+    Progress of one download, reported as a "." on stdout per chunk.
+
+    Dots pile up in the stdout buffer and are flushed every `_DOTS_PER_FLUSH`
+    chunks, so progress costs a syscall per 64 MiB rather than per MiB. The
+    count belongs to a single download and is shared by its range workers
+    under a lock, so concurrent downloads do not disturb each other's count.
+    """
+
+    def __init__(self) -> None:
+        self._dots = 0
+        self._lock = threading.Lock()
+
+    def tick(self) -> None:
+        """
+        Report one downloaded chunk.
+        """
+        with self._lock:
+            self._dots += 1
+            flush = self._dots % _DOTS_PER_FLUSH == 0
+        sys.stdout.write(".")
+        if flush:
+            sys.stdout.flush()
+
+    def end(self) -> None:
+        """
+        Terminate the line of progress dots, if any were printed.
+        """
+        with self._lock:
+            dots, self._dots = self._dots, 0
+        if dots:
+            sys.stdout.write("\n")
+            sys.stdout.flush()
+
+
+def _copy(src: BinaryIO, dst: BinaryIO, progress: _Progress | None = None) -> None:
+    """
+    Copy `src` into the unbuffered file `dst` in `_COPY_CHUNK` reads,
+    ticking `progress` per chunk if one is given.
+
+    Each chunk goes from the bytes returned by read() straight into one
+    write() syscall. sendfile() cannot take a socket (or a TLS stream) as its
+    source, so this is as close to zero-copy as a download gets: it avoids
+    the extra pass through a BufferedWriter that copyfileobj would make.
+    """
+    while chunk := src.read(_COPY_CHUNK):
+        _write_all(dst, chunk)
+        if progress:
+            progress.tick()
+
+
+def _fadvise(fd: int, advice: str) -> None:
+    """
+    Give the kernel a posix_fadvise() hint (e.g. "POSIX_FADV_DONTNEED") for
+    the whole of `fd`; a no-op where it is unsupported (Windows, macOS).
+    """
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, 0, 0, getattr(os, advice))
+
+
+def _ensure_dir(path: Path) -> None:
+    """
+    Create `path` and its parents unless it already is a directory.
+
+    The stat() settles the common already-exists case without the mkdir()
+    that makedirs(exist_ok=True) would still issue and see fail with EEXIST.
+    """
+    try:
+        if stat.S_ISDIR(os.stat(path).st_mode):
+            return
+    except FileNotFoundError:
+        pass
+    os.makedirs(path, exist_ok=True)
+
+
+def _request_range(url: str, lo: int, hi: int, validator: str | None) -> urllib3.BaseHTTPResponse | None:
+    """
+    Start a GET for bytes `lo`..`hi` (inclusive) of `url`.
+
+    Returns:
+        The streaming 206 response, or None if the server ignored the Range
+        (answered 200), e.g. because `validator` no longer matches.
+
+    Raises:
+        urllib.error.HTTPError: If the server answers with an error status.
+    """
+    headers = {**_HEADERS, "Range": f"bytes={lo}-{hi}"}
+    if validator:
+        headers["If-Range"] = validator
+    resp = _http().request("GET", url, headers=headers, preload_content=False)
+    if resp.status == 206:
+        return resp
+    if resp.status == 200:
+        resp.close()
+        resp.release_conn()
+        return None
+    resp.drain_conn()
+    resp.release_conn()
+    raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, None)
+
+
+def _fetch_range(
+    url: str, part_path: Path, lo: int, hi: int, validator: str | None, progress: _Progress | None = None
+) -> bool:
+    """
+    Write bytes `lo`..`hi` (inclusive) of `url` at the same offsets of `part_path`.
+
+    Returns:
+        False if the server ignored the Range request.
+    """
+    resp = _request_range(url, lo, hi, validator)
+    if resp is None:
+        return False
+    try:
+        with open(part_path, "r+b", buffering=0) as fh:
+            fh.seek(lo)
+            _copy(resp, fh, progress)
+    finally:
+        resp.release_conn()
+    return True
+
+
+def _split_ranges(size: int, parallel: int) -> list[tuple[int, int]]:
+    """
+    Cut `size` bytes into consecutive half-open (lo, hi) ranges for
+    `parallel` connections: one range unless the body is large enough to
+    split, otherwise up to `_MAX_RANGES` of at least `_RANGE_MIN_SIZE` bytes
+    (never fewer than `parallel`).
+    """
+    count = 1
+    if parallel > 1 and size > _PARALLEL_MIN_SIZE:
+        count = max(parallel, min(_MAX_RANGES, size // _RANGE_MIN_SIZE))
+    step = -(-size // count) or 1
+    return [(lo, min(lo + step, size)) for lo in range(0, size, step)]
+
+
+def _download_ranges(
+    url: str, part_path: Path, size: int, validator: str | None, parallel: int, progress: _Progress | None = None
+) -> bool:
+    """
+    Fetch `size` bytes of `url` into `part_path` as Range requests spread
+    over `parallel` connections, each writing into its own slice of the
+    file, which is first sized to `size` as a sparse file.
+
+    Returns:
+        False if the server ignored a Range request (answered 200), in which
+        case the caller should fall back to a single stream.
+    """
+    with open(part_path, "wb") as fh:
+        fh.truncate(size)
+
+    ranges = [(lo, hi - 1) for lo, hi in _split_ranges(size, parallel)]
+
+    ignored = threading.Event()
+
+    def fetch(lo: int, hi: int) -> bool:
+        # Once the server has ignored one Range, do not ask again
+        if ignored.is_set() or not _fetch_range(url, part_path, lo, hi, validator, progress):
+            ignored.set()
+            return False
+        return True
+
+    # Workers spend their time blocked in socket reads, which release the GIL
+    with ThreadPoolExecutor(max_workers=parallel) as ex:
+        return all(list(ex.map(lambda r: fetch(*r), ranges)))
+
+
+def _download(
+    url: str, zip_path: Path, parallel: int = 1, spool: bool = False, progress: _Progress | None = None
+) -> Path | BinaryIO:
+    """
+    Stream `url` into `zip_path`, or into memory when `spool` is True.
+
+    The body is first written to `<zip_path>.part` and renamed once complete.
+    The server's ETag (or Last-Modified) is kept in `<zip_path>.etag` so that:
+      - an interrupted `.part` file is resumed with `Range` + `If-Range`;
+      - an existing `zip_path` is revalidated with `If-None-Match` /
+        `If-Modified-Since` and left untouched if the server answers 304.
+
+    A fresh download of a large archive is split across `parallel` Range
+    requests when the server advertises `Accept-Ranges: bytes`.
+
+    With `spool`, a fresh body of at most `_SPOOL_MAX_SIZE` bytes (or of
+    unknown length) never touches `dest_folder`: it is buffered in a
+    SpooledTemporaryFile that only rolls over to disk if it outgrows memory.
+
+    Returns:
+        `zip_path`, or the rewound spool holding the archive.
+
+    Raises:
+        urllib.error.HTTPError: If the server answers with an error status.
+    """
+    part_path = zip_path.with_name(zip_path.name + ".part")
+    tag_path = zip_path.with_name(zip_path.name + ".etag")
+    validator = tag_path.read_text().strip() if tag_path.exists() else None
+
+    headers = dict(_HEADERS)
+    offset = 0
+    if validator and zip_path.exists():
+        is_etag = validator.startswith(('"', 'W/'))
+        headers["If-None-Match" if is_etag else "If-Modified-Since"] = validator
+    elif validator and part_path.exists():
+        offset = part_path.stat().st_size
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+    elif parallel > 1:
+        head = _http().request("HEAD", url)
+        size = int(head.headers.get("Content-Length") or 0)
+        if head.headers.get("Accept-Ranges") == "bytes" and size > _PARALLEL_MIN_SIZE:
+            # The sparse file has holes until every range lands, so it
+            # must never look resumable: the validator is written last.
+            tag_path.unlink(missing_ok=True)
+            new_validator = head.headers.get("ETag") or head.headers.get("Last-Modified")
+            print(f"Downloading {size} bytes over {parallel} connections...")
+            if _download_ranges(url, part_path, size, new_validator, parallel, progress):
+                if new_validator:
+                    tag_path.write_text(new_validator)
+                part_path.replace(zip_path)
+                return zip_path
+            print("Server ignored Range requests, falling back to a single stream...")
+
+    resp = _http().request("GET", url, headers=headers, preload_content=False)
+    try:
+        if resp.status == 304:
+            resp.drain_conn()
+            print(f"Already up to date: {zip_path}")
+            return zip_path
+        if resp.status == 416 and offset:
+            # The partial file already holds the whole (unchanged) body
+            resp.drain_conn()
+            part_path.replace(zip_path)
+            return zip_path
+        if resp.status not in (200, 206):
+            resp.drain_conn()
+            raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, None)
+        if resp.status == 200:
+            # Fresh body: either no resume was asked or the server refused it
+            offset = 0
+            length = resp.headers.get("Content-Length")
+            if spool and (length is None or int(length) <= _SPOOL_MAX_SIZE):
+                buf = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_SIZE)
+                _copy(resp, buf, progress)
+                buf.seek(0)
+                # The spool supersedes whatever an earlier call left behind:
+                # a stale partial would be resumed, a stale archive revalidated
+                for stale in (part_path, tag_path, zip_path):
+                    stale.unlink(missing_ok=True)
+                return buf
+
+        new_validator = resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+        if new_validator:
+            tag_path.write_text(new_validator)
+        else:
+            tag_path.unlink(missing_ok=True)
+
+        if offset:
+            print(f"Resuming at byte {offset}...")
+        with open(part_path, "ab" if offset else "wb", buffering=0) as fh:
+            _copy(resp, fh, progress)
+    finally:
+        resp.release_conn()
+
+    part_path.replace(zip_path)
+    return zip_path
+
+
+def _select(zip_ref: zipfile.ZipFile, members: list[str] | Callable[[str], bool] | None) -> list[zipfile.ZipInfo]:
+    """
+    Resolve `members` (names, a predicate on names, or None for everything)
+    to ZipInfo objects. As with extractall, the last entry wins for a
+    duplicated name and an unknown name raises KeyError.
+    """
+    if members is None or callable(members):
+        infos = {i.filename: i for i in zip_ref.infolist()}.values()
+        return [i for i in infos if members is None or members(i.filename)]
+    return [zip_ref.getinfo(name) for name in dict.fromkeys(members)]
+
+
+def _member_ends(zip_ref: zipfile.ZipFile) -> dict[int, int]:
+    """
+    Map each member's header offset to the offset where its data ends:
+    the next local header, or the central directory for the last member.
+    """
+    offsets = sorted(i.header_offset for i in zip_ref.infolist())
+    return dict(zip(offsets, offsets[1:] + [zip_ref.start_dir]))
+
+
+def _member_target(info: zipfile.ZipInfo, dest_folder: Path) -> Path:
+    """
+    Map a member to its path under `dest_folder`, sanitised like
+    ZipFile.extract does: drive letters, absolute prefixes and "."/".."
+    components are dropped so nothing lands outside `dest_folder`.
+    """
+    arcname = info.filename.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    invalid = ('', os.path.curdir, os.path.pardir)
+    arcname = os.path.sep.join(x for x in arcname.split(os.path.sep) if x not in invalid)
+    if os.path.sep == '\\':
+        arcname = zipfile.ZipFile._sanitize_windows_name(arcname, os.path.sep)
+    return dest_folder / arcname
+
+
+def _extract(
+    archive: Path | BinaryIO,
+    dest_folder: Path,
+    wait: Callable[[int], None] | None = None,
+    members: list[str] | Callable[[str], bool] | None = None
+) -> None:
+    """
+    Extract the `members` of `archive` (all by default) into `dest_folder`
+    on a thread pool.
+
+    Directory entries and the parents of all members are created first, on
+    the calling thread, so workers do not race on them. zlib releases the
+    GIL while inflating, so members are decompressed on all cores: each
+    worker opens its own ZipFile on an on-disk archive, while a spool is
+    shared (ZipFile serialises the reads).
+    Deflated members are inflated with ISA-L when `isal` is installed.
+
+    Members are dispatched largest first. If `wait` is given, they are
+    dispatched in archive order instead and `wait(end)` is called first,
+    blocking until the archive holds its bytes up to `end`.
+    """
+    with zipfile.ZipFile(archive, 'r') as zip_ref:
+        files = []
+        targets: dict[zipfile.ZipInfo, Path] = {}
+        dirs: set[Path] = set()
+        for info in _select(zip_ref, members):
+            target = _member_target(info, dest_folder)
+            if info.is_dir():
+                dirs.add(target)
+            else:
+                files.append(info)
+                targets[info] = target
+                dirs.add(target.parent)
+        # Each directory is created once, parents first, before any worker
+        # starts, so workers never stat or mkdir. Into a fresh destination a
+        # bare mkdir() then succeeds, so try it before stat-ing anything.
+        for d in sorted(dirs, key=lambda p: len(p.parts)):
+            try:
+                os.mkdir(d)
+            except OSError:
+                _ensure_dir(d)
+
+        if wait is not None:
+            ends = _member_ends(zip_ref)
+            files.sort(key=lambda i: i.header_offset)
+
+            def arrived(infos: list[zipfile.ZipInfo]):
+                for info in infos:
+                    wait(ends[info.header_offset])
+                    yield info
+
+            files = arrived(files)
+        else:
+            # Largest first, so a big member started last does not leave one
+            # worker running alone after the others have finished
+            files.sort(key=lambda i: i.file_size, reverse=True)
+
+        handles: list[zipfile.ZipFile | BinaryIO] = []
+        local = threading.local()
+
+        def extract_one(info: zipfile.ZipInfo) -> None:
+            if not isinstance(archive, Path):
+                source = zip_ref
+            else:
+                if not hasattr(local, "zip_ref"):
+                    if wait is None:
+                        local.zip_ref = zipfile.ZipFile(archive, 'r')
+                    else:
+                        # Bytes past a member may not have landed yet: a read
+                        # buffer would hold on to them as zeros for the next one
+                        raw = open(archive, "rb", buffering=0)
+                        handles.append(raw)
+                        local.zip_ref = zipfile.ZipFile(raw, 'r')
+                    # Each worker streams through its members: widen readahead
+                    _fadvise(local.zip_ref.fp.fileno(), "POSIX_FADV_SEQUENTIAL")
+                    handles.append(local.zip_ref)
+                source = local.zip_ref
+            target = targets[info]
+            # Inflate in _COPY_CHUNK pieces rather than extract()'s small
+            # default buffer: fewer round-trips, and memory stays bounded
+            with source.open(info) as src, open(target, "wb", buffering=0) as dst:
+                if isal_zlib is not None and info.compress_type == zipfile.ZIP_DEFLATED:
+                    # Nothing has been read yet: swap in the faster inflater
+                    src._decompressor = isal_zlib.decompressobj(-15)
+                _copy(src, dst)
+
+        try:
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+                for _ in ex.map(extract_one, files):
+                    pass
+        finally:
+            for handle in reversed(handles):
+                handle.close()
+
+
+def _central_directory_start(tail: bytes, tail_lo: int) -> int | None:
+    """
+    Locate the central directory from the end-of-central-directory record in
+    `tail`, the last bytes of an archive starting at offset `tail_lo`.
+
+    In a ZIP64 archive the central directory is followed by the ZIP64 end
+    record and its locator, and the sizes are read from that record.
+
+    Returns:
+        The archive offset of the central directory, or None if no record is
+        found.
+    """
+    pos = tail.rfind(b"PK\x05\x06")
+    if pos < 0 or len(tail) - pos < 22:
+        return None
+    cd_size, = struct.unpack_from("<L", tail, pos + 12)
+    if pos >= 20 and tail[pos - 20:pos - 16] == b"PK\x06\x07":
+        # 20-byte locator, preceded by a 56-byte record (no extensible data)
+        pos -= 20 + 56
+        if pos < 0 or tail[pos:pos + 4] != b"PK\x06\x06":
+            return None
+        cd_size, = struct.unpack_from("<Q", tail, pos + 40)
+    return tail_lo + pos - cd_size
+
+
+def _download_pipelined(
+    url: str,
+    zip_path: Path,
+    dest_folder: Path,
+    discard: bool,
+    members: list[str] | Callable[[str], bool] | None = None,
+    parallel: int = 1,
+    progress: _Progress | None = None
+) -> Path | None:
+    """
+    Download `url` to `zip_path` while extracting it into `dest_folder`.
+
+    The central directory is fetched first with a Range request for the end
+    of the archive. The body is then streamed from the start on a background
+    thread, and each member is handed to the extractors as soon as its bytes
+    have landed, so network transfer and inflating overlap. A large body is
+    fetched as consecutive ranges over `parallel` connections; members are
+    released as the contiguous prefix of landed bytes grows.
+
+    When the archive is going to be discarded and only some `members` are
+    wanted, only their byte ranges are fetched instead of the whole body.
+
+    Returns:
+        The downloaded archive (`zip_path`, or a sparse `.part` file when only
+        selected members were fetched), or None if the caller should take the
+        regular path: a resume or revalidation is pending, the server does not
+        serve ranges, or the archive is small enough to spool.
+    """
+    part_path = zip_path.with_name(zip_path.name + ".part")
+    tag_path = zip_path.with_name(zip_path.name + ".etag")
+    if tag_path.exists() and (zip_path.exists() or part_path.exists()):
+        return None
+
+    head = _http().request("HEAD", url)
+    size = int(head.headers.get("Content-Length") or 0)
+    if head.headers.get("Accept-Ranges") != "bytes" or not size:
+        return None
+    if discard and members is None and size <= _SPOOL_MAX_SIZE:
+        return None
+    validator = head.headers.get("ETag") or head.headers.get("Last-Modified")
+    tag_path.unlink(missing_ok=True)
+
+    with open(part_path, "wb") as fh:
+        fh.truncate(size)
+    body_end = max(0, size - _TAIL_SIZE)
+    if not _fetch_range(url, part_path, body_end, size - 1, validator, progress):
+        part_path.unlink()
+        return None
+    with open(part_path, "rb") as fh:
+        fh.seek(body_end)
+        cd_start = _central_directory_start(fh.read(), body_end)
+    if cd_start is not None and cd_start < body_end:
+        if not _fetch_range(url, part_path, cd_start, body_end - 1, validator, progress):
+            part_path.unlink()
+            return None
+        body_end = cd_start
+
+    if discard and members is not None and cd_start is not None:
+        try:
+            with zipfile.ZipFile(part_path, 'r') as zip_ref:
+                ends = _member_ends(zip_ref)
+                spans = sorted((i.header_offset, ends[i.header_offset]) for i in _select(zip_ref, members))
+            # Coalesce neighbouring members into as few requests as possible;
+            # everything from body_end on is already on disk
+            ranges: list[list[int]] = []
+            for lo, hi in spans:
+                hi = min(hi, body_end)
+                if lo >= hi:
+                    continue
+                if ranges and lo <= ranges[-1][1]:
+                    ranges[-1][1] = max(ranges[-1][1], hi)
+                else:
+                    ranges.append([lo, hi])
+            print(f"Fetching {len(spans)} selected members in {len(ranges)} range requests...")
+            for lo, hi in ranges:
+                if not _fetch_range(url, part_path, lo, hi - 1, validator, progress):
+                    raise urllib.error.HTTPError(url, 200, "Archive changed during download", head.headers, None)
+            _extract(part_path, dest_folder, members=members)
+        except BaseException:
+            # The sparse file is of no use to a later call: nothing resumes it
+            part_path.unlink(missing_ok=True)
+            raise
+        return part_path
+
+    parts = _split_ranges(body_end, parallel)
+    starts = [lo for lo, _ in parts]
+    ends = [hi for _, hi in parts]
+    # Bytes landed so far in each range, and the first range not yet complete
+    landed = [0] * len(starts)
+    first = 0
+    written = 0
+    done = False
+    errors: list[BaseException] = []
+    arrived = threading.Condition()
+    cancel = threading.Event()
+
+    def fetch(i: int) -> None:
+        nonlocal written, first
+        try:
+            resp = _request_range(url, starts[i], ends[i] - 1, validator)
+            if resp is None:
+                raise urllib.error.HTTPError(url, 200, "Archive changed during download", head.headers, None)
+            try:
+                with open(part_path, "r+b", buffering=0) as fh:
+                    fh.seek(starts[i])
+                    while not cancel.is_set() and (chunk := resp.read(_COPY_CHUNK)):
+                        _write_all(fh, chunk)
+                        if progress:
+                            progress.tick()
+                        with arrived:
+                            landed[i] += len(chunk)
+                            while first < len(starts) and starts[first] + landed[first] >= ends[first]:
+                                first += 1
+                            written = starts[first] + landed[first] if first < len(starts) else body_end
+                            arrived.notify_all()
+            finally:
+                resp.release_conn()
+        except BaseException:
+            # Stop the other ranges too
+            cancel.set()
+            raise
+
+    def stream_body() -> None:
+        nonlocal done
+        try:
+            # Workers spend their time blocked in socket reads, which release the GIL
+            with ThreadPoolExecutor(max_workers=min(parallel, len(starts)) or 1) as ex:
+                for _ in ex.map(fetch, range(len(starts))):
+                    pass
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            with arrived:
+                done = True
+                arrived.notify_all()
+
+    def wait(end: int) -> None:
+        # Everything from body_end on is already on disk
+        end = min(end, body_end)
+        with arrived:
+            arrived.wait_for(lambda: written >= end or done)
+        if errors:
+            raise errors[0]
+
+    if cd_start is None:
+        # Without a locatable central directory, extract once the body is in
+        stream_body()
+        if errors:
+            raise errors[0]
+        _extract(part_path, dest_folder, members=members)
+    else:
+        producer = threading.Thread(target=stream_body, daemon=True)
+        producer.start()
+        try:
+            _extract(part_path, dest_folder, wait, members)
+        except BaseException:
+            cancel.set()
+            raise
+        finally:
+            producer.join()
+        if errors:
+            raise errors[0]
+
+    if validator:
+        tag_path.write_text(validator)
+    part_path.replace(zip_path)
+    return zip_path
 
 
 def download_and_extract_zip(
     url: str,
     dest_folder: str | Path,
     unzip: bool = True,
-    delete_zip: bool = True
+    delete_zip: bool = True,
+    parallel: int = 1,
+    members: list[str] | Callable[[str], bool] | None = None,
+    prefer_native: bool = False
 ) -> None:
     """
     Works on Windows, macOS, and Ubuntu.
     Download a ZIP file from the given URL into the specified folder (string or Path),
     optionally extract it, and optionally remove the archive.
 
+    An interrupted download is resumed on the next call, and an archive kept
+    from a previous call (`delete_zip=False`) is only re-downloaded if the
+    server reports that it changed.
+
     Args:
         url (str): URL of the ZIP file to download.
         dest_folder (str | Path): Directory path (string or Path) where the file will be saved/extracted.
         unzip (bool): If True, extract the ZIP archive into `dest_folder` after download. Defaults to True.
         delete_zip (bool): If True, delete the downloaded ZIP file after extraction. Defaults to True.
+        parallel (int): Number of concurrent Range requests used for large archives, at most 16.
+            Defaults to 1.
+        members (list[str] | Callable[[str], bool] | None): Names to extract, or a predicate
+            on member names; None extracts everything. When the archive is not kept and the
+            server supports Range requests, only the selected members are downloaded.
+        prefer_native (bool): If True and `unzip` is on PATH, extract the whole archive with it
+            once downloaded, e.g. to restore Unix permissions and symlinks. Slower than the
+            built-in extraction, which inflates on all cores. Defaults to False.
 
     Raises:
-        URLError, HTTPError: If downloading the file fails.
+        urllib3.exceptions.HTTPError: If the connection to the server fails.
+        urllib.error.HTTPError: If the server answers with an error status.
         zipfile.BadZipFile: If the downloaded file is not a valid ZIP archive.
+        KeyError: If a name in `members` is not in the archive.
+        subprocess.CalledProcessError: If the native `unzip` fails.
     """
     # Normalize destination to Path
     dest_folder = Path(dest_folder)
-    dest_folder.mkdir(parents=True, exist_ok=True)
+    # More connections than the pool keeps alive would be reopened every time
+    parallel = max(1, min(parallel, _MAX_RANGES))
+    _ensure_dir(dest_folder)
 
     # Determine zip filename and full path
-    zip_name = os.path.basename(url)
+    # From the path only: a query string ("?sig=...") is not part of the name
+    zip_name = os.path.basename(urllib.parse.urlsplit(url).path)
+    if zip_name in ("", os.path.curdir, os.path.pardir):
+        zip_name = "download.zip"
     zip_path = dest_folder / zip_name
 
     print(f"Downloading from {url}...")
-    # urllib expects a string path
-    urllib.request.urlretrieve(url, str(zip_path))
+    native = shutil.which("unzip") if prefer_native and unzip and members is None else None
+    archive = None
+    progress = _Progress()
+    if unzip and not native:
+        try:
+            archive = _download_pipelined(url, zip_path, dest_folder, delete_zip, members, parallel, progress)
+        finally:
+            progress.end()
+        if archive is not None:
+            print(f"Extracted to {dest_folder} while downloading.")
+    if archive is None:
+        # An archive that is extracted and thrown away does not need to hit dest_folder
+        try:
+            archive = _download(url, zip_path, parallel, spool=unzip and delete_zip and not native, progress=progress)
+        finally:
+            progress.end()
+        if unzip:
+            print(f"Extracting to {dest_folder}...")
+            if native:
+                # Exit status 1 only reports warnings, such as stripped "../" components
+                result = subprocess.run([native, "-q", "-o", str(archive), "-d", str(dest_folder)])
+                if result.returncode > 1:
+                    raise subprocess.CalledProcessError(result.returncode, result.args)
+            else:
+                _extract(archive, dest_folder, members=members)
 
-    if unzip:
-        print(f"Extracting to {dest_folder}...")
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(dest_folder)
-
-    if delete_zip:
-        zip_path.unlink()
-        print(f"Deleted zip file: {zip_path}")
+    if not isinstance(archive, Path):
+        archive.close()
+    elif delete_zip:
+        # Unlinking also releases the archive's page cache
+        archive.unlink()
+        zip_path.with_name(zip_path.name + ".etag").unlink(missing_ok=True)
+        print(f"Deleted zip file: {archive}")
+    elif unzip:
+        # The kept archive will not be read again soon: let its cached pages
+        # (those already written back) go instead of evicting other data
+        with open(archive, "rb") as fh:
+            _fadvise(fh.fileno(), "POSIX_FADV_DONTNEED")
 
     print("Done.")
 
 
+async def download_and_extract_zip_async(url: str, dest_folder: str | Path, *args, **kwargs) -> None:
+    """
+    Awaitable form of `download_and_extract_zip`, taking the same arguments.
+
+    The download runs on the default executor, so several archives can be
+    fetched at once with asyncio.gather() while sharing the connection pool.
+    """
+    await asyncio.to_thread(download_and_extract_zip, url, dest_folder, *args, **kwargs)
+
+
+def _access_bits(path: Path, wanted: int) -> int | None:
+    """
+    Return which of the os.R_OK / os.W_OK / os.X_OK flags in `wanted` the
+    caller has on `path`, or None if it does not exist.
+
+    A single access() call answers the common all-granted case; only when
+    it fails is each flag asked about on its own. Going through the kernel
+    keeps root, ACLs and read-only or noexec mounts right.
+    """
+    if os.access(path, wanted):
+        return wanted
+    try:
+        os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return sum(flag for flag in (os.R_OK, os.W_OK, os.X_OK) if wanted & flag and os.access(path, flag))
+
+
+# Path sets that already passed every check (without creating) in this process.
+_ENSURE_PATHS_OK: set[tuple] = set()
+# Path lists at least this long are checked on a thread pool.
+_ENSURE_PATHS_PARALLEL_MIN = 32
+
+
 def ensure_paths(
     dirs_list: list[str | Path] | None = None,
     file_paths: list[str | Path] | None = None,
@@ -76,6 +836,11 @@ def ensure_paths(
              • Otherwise report an error.
           3. Verify the file is readable, writable, and executable.
 
+    Without `create_dir` and `create_file`, paths that passed once are not
+    checked again for the rest of the process; call
+    `ensure_paths.clear_cache()` after changing the tree. Calls that may
+    create paths always run, so that the paths exist when they return.
+
     Args:
         dirs_list:     List of directories (str or Path) to check.
         file_paths:    List of file paths (str or Path) to check.
@@ -86,150 +851,395 @@ def ensure_paths(
         False if all checks pass;
         otherwise a newline-separated string describing every error found.
     """
+    key = None
+    if not create_dir and not create_file:
+        try:
+            key = (
+                # Absolute, so relative paths are not reused from another cwd
+                frozenset(map(os.path.abspath, dirs_list or ())),
+                frozenset(map(os.path.abspath, file_paths or ())),
+            )
+        except TypeError:
+            # Invalid entries are reported below and never cached
+            pass
+        if key in _ENSURE_PATHS_OK:
+            return False
+
     errors: list[str] = []
 
     # --- Check directories ---
-    if dirs_list:
-        for d in dirs_list:
-            try:
-                dir_path = Path(d)
-                if not dir_path.exists():
-                    if create_dir:
-                        dir_path.mkdir(parents=True, exist_ok=True)
-                    else:
-                        errors.append(
-                            f"Directory does not exist: {dir_path}. Create it or set create_dir=True."
-                        )
-                        continue
-                if not os.access(dir_path, os.R_OK):
-                    errors.append(
-                        f"Directory is not readable: {dir_path}. Set read permission: chmod +r '{dir_path}'"
-                    )
-                if not os.access(dir_path, os.W_OK):
-                    errors.append(
-                        f"Directory is not writable: {dir_path}. Set write permission: chmod +w '{dir_path}'"
+    def check_dir(d: str | Path) -> list[str]:
+        errs: list[str] = []
+        try:
+            dir_path = d if isinstance(d, Path) else Path(d)
+            allowed = _access_bits(dir_path, os.R_OK | os.W_OK)
+            if allowed is None:
+                if create_dir:
+                    dir_path.mkdir(parents=True, exist_ok=True)
+                    allowed = _access_bits(dir_path, os.R_OK | os.W_OK)
+                else:
+                    errs.append(
+                        f"Directory does not exist: {dir_path}. Create it or set create_dir=True."
                     )
-            except Exception as e:
-                errors.append(f"Error handling directory '{d}': {e}")
+                    return errs
+            if not allowed & os.R_OK:
+                errs.append(
+                    f"Directory is not readable: {dir_path}. Set read permission: chmod +r '{dir_path}'"
+                )
+            if not allowed & os.W_OK:
+                errs.append(
+                    f"Directory is not writable: {dir_path}. Set write permission: chmod +w '{dir_path}'"
+                )
+        except Exception as e:
+            errs.append(f"Error handling directory '{d}': {e}")
+        return errs
 
     # --- Check files ---
-    if file_paths:
-        for f in file_paths:
-            try:
-                file_path = Path(f)
-                parent = file_path.parent or Path('.')
-                if not parent.exists():
-                    if create_file:
-                        parent.mkdir(parents=True, exist_ok=True)
-                    else:
-                        errors.append(
-                            f"Parent directory does not exist: {parent}. Create it or set create_file=True."
-                        )
-                        continue
-                if not file_path.exists():
-                    if create_file:
-                        file_path.touch()
-                    else:
-                        errors.append(
-                            f"File does not exist: {file_path}. Create it or set create_file=True."
-                        )
-                        continue
-                if not os.access(file_path, os.R_OK):
-                    errors.append(
-                        f"File is not readable: {file_path}. Set read permission: chmod +r '{file_path}'"
-                    )
-                if not os.access(file_path, os.W_OK):
-                    errors.append(
-                        f"File is not writable: {file_path}. Set write permission: chmod +w '{file_path}'"
-                    )
-                if not os.access(file_path, os.X_OK):
-                    errors.append(
-                        f"File is not executable: {file_path}. Set execute permission: chmod +x '{file_path}'"
+    # Files usually share a few parents: check each of them only once, and
+    # remember missing ones too
+    parents: dict[Path, bool] = {}
+
+    def check_file(f: str | Path) -> list[str]:
+        errs: list[str] = []
+        try:
+            file_path = f if isinstance(f, Path) else Path(f)
+            parent = file_path.parent or Path('.')
+            parent_ok = parents.get(parent)
+            if parent_ok is None:
+                if create_file:
+                    _ensure_dir(parent)
+                    parent_ok = True
+                else:
+                    parent_ok = parent.exists()
+                parents[parent] = parent_ok
+            if not parent_ok:
+                errs.append(
+                    f"Parent directory does not exist: {parent}. Create it or set create_file=True."
+                )
+                return errs
+            allowed = _access_bits(file_path, os.R_OK | os.W_OK | os.X_OK)
+            if allowed is None:
+                if create_file:
+                    # Raw fd: no buffered file object just to make an empty file
+                    os.close(os.open(file_path, os.O_WRONLY | os.O_CREAT | getattr(os, "O_CLOEXEC", 0), 0o666))
+                    allowed = _access_bits(file_path, os.R_OK | os.W_OK | os.X_OK)
+                else:
+                    errs.append(
+                        f"File does not exist: {file_path}. Create it or set create_file=True."
                     )
-            except Exception as e:
-                errors.append(f"Error handling file '{f}': {e}")
+                    return errs
+            if not allowed & os.R_OK:
+                errs.append(
+                    f"File is not readable: {file_path}. Set read permission: chmod +r '{file_path}'"
+                )
+            if not allowed & os.W_OK:
+                errs.append(
+                    f"File is not writable: {file_path}. Set write permission: chmod +w '{file_path}'"
+                )
+            if not allowed & os.X_OK:
+                errs.append(
+                    f"File is not executable: {file_path}. Set execute permission: chmod +x '{file_path}'"
+                )
+        except Exception as e:
+            errs.append(f"Error handling file '{f}': {e}")
+        return errs
 
+    # Directories go first since files may live in them. Long lists are
+    # checked on a thread pool so that stat() round-trips (slow on network
+    # filesystems) overlap; map() keeps the errors in input order.
+    for check, paths in ((check_dir, dirs_list), (check_file, file_paths)):
+        if not paths:
+            continue
+        if len(paths) < _ENSURE_PATHS_PARALLEL_MIN:
+            results = map(check, paths)
+        else:
+            with ThreadPoolExecutor(max_workers=min(32, len(paths))) as ex:
+                results = list(ex.map(check, paths))
+        for errs in results:
+            errors.extend(errs)
+
+    if not errors and key is not None:
+        _ENSURE_PATHS_OK.add(key)
     return False if not errors else "\n".join(errors)
 
 
+ensure_paths.clear_cache = _ENSURE_PATHS_OK.clear
+
+
 
 import subprocess, re
 from pathlib import Path
 
+# The package lists are refreshed at most once in this many seconds.
+_APT_UPDATE_TTL = 3600
+# First package name of each non-blank, non-comment line of a deps file,
+# and the rest of that line up to any trailing comment.
+_DEP_RE = re.compile(r"^[ \t]*(?!#)([^\s(|#]+)([^\n#]*)", re.M)
+# Alternate names in the rest of a line: "| name (constraint)".
+_ALT_RE = re.compile(r"\|\s*([^\s(|]+)")
+# How names were classified is remembered across runs for as long as neither
+# of these changes: apt renames list files into place on every update that
+# brings new lists, which also tells how fresh they are.
+_APT_LISTS = "/var/lib/apt/lists"
+_DPKG_STATUS = "/var/lib/dpkg/status"
+# Architecture qualifiers that apt-cache showpkg prints bare, like the native one.
+_ARCH_BARE = ("", "any", "all", "native")
+
+
+def _cache_dir() -> Path:
+    """
+    Return this package's directory under $XDG_CACHE_HOME (default ~/.cache).
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "soaresmodules"
+
+
+def _apt_resolved_path() -> Path:
+    """
+    Return the JSON file remembering how package names were classified.
+    """
+    return _cache_dir() / "apt_resolved.json"
+
+
+@contextlib.contextmanager
+def _noninteractive_env():
+    """
+    Set DEBIAN_FRONTEND=noninteractive in os.environ for the duration, so
+    that dpkg forked by python3-apt never stops on a debconf prompt.
+    """
+    saved = os.environ.get("DEBIAN_FRONTEND")
+    os.environ["DEBIAN_FRONTEND"] = "noninteractive"
+    try:
+        yield
+    finally:
+        if saved is None:
+            del os.environ["DEBIAN_FRONTEND"]
+        else:
+            os.environ["DEBIAN_FRONTEND"] = saved
+
+
+def _parse_showpkg(text: str) -> tuple[set[str], set[str], dict[str, str]]:
+    """
+    Read the output of `apt-cache showpkg` for several names.
+
+    Returns:
+        The names apt knows about, those with versions of their own, and the
+        first provider listed under 'Reverse Provides:' for each name.
+    """
+    known: set[str] = set()
+    real: set[str] = set()
+    providers: dict[str, str] = {}
+    current = None
+    section = None
+    for line in text.splitlines():
+        stripped = line.strip()
+        if line.startswith("Package: "):
+            current = stripped.split(None, 1)[1]
+            known.add(current)
+            section = None
+        elif stripped.endswith(":") and not line[0].isspace():
+            section = stripped
+        elif not stripped or line[0].isspace():
+            # blank separators and indented version details
+            continue
+        elif section == "Versions:":
+            real.add(current)
+        elif section == "Reverse Provides:":
+            providers.setdefault(current, stripped.split()[0])
+    return known, real, providers
+
 
-def install_deb_deps(deps_file: str | Path) -> None:
+def _showpkg_name(pkg: str, native: str | None) -> str:
     """
-    Read deb.deps, strip constraints/alternates, update apt,
-    then resolve each pkg:
-      1) If apt-cache show finds it, install that.
-      2) Else look under 'Reverse Provides:' in showpkg,
-         and take the very next non-empty line as the provider.
-    Finally batch-install them all.
+    Spell `pkg` the way `apt-cache showpkg` names it: a qualifier for the
+    `native` architecture (or ":any", ":all", ":native") is dropped, a
+    foreign one such as ":i386" is kept.
     """
-    # 1) Read + clean
-    lines = Path(deps_file).read_text().splitlines()
-    raw = [ln.strip() for ln in lines if ln.strip() and not ln.strip().startswith("#")]
+    name, _, arch = pkg.partition(":")
+    return name if arch in _ARCH_BARE or arch == native else pkg
 
-    # 2) Normalize names
-    pkgs = [re.sub(r"\s*\([^)]*\)", "", ln).split("|",1)[0].strip()
-            for ln in raw]
-    if not pkgs:
+
+def install_deb_deps(deps_file: str | Path, force_update: bool = False) -> None:
+    """
+    Read deb.deps, strip constraints, update apt
+    (only if the package lists are over an hour old, or `force_update`),
+    then batch-install them all with a single apt-get call.
+    Names are classified beforehand by one `apt-cache showpkg` call:
+      - a name with versions of its own is installed as is;
+      - a virtual one is replaced by the very next non-empty line under
+        'Reverse Provides:', i.e. its first provider;
+      - otherwise its "| alternates" are tried in the same way, in order;
+      - anything else is skipped with a warning.
+    When running as root with python3-apt available, the same steps run
+    in-process against one loaded apt cache instead of apt-get/apt-cache.
+    Classifications are kept in ~/.cache/soaresmodules/apt_resolved.json
+    and reused until the package lists or the dpkg status change.
+    """
+    # 1+2) Read every non-comment line in one pass: its first name, and the
+    #      alternates to fall back on
+    deps = [(pkg, _ALT_RE.findall(rest)) for pkg, rest in _DEP_RE.findall(Path(deps_file).read_text())]
+    if not deps:
         print("No packages to install.")
         return
 
-    # 3) Refresh once
-    subprocess.run(["sudo","apt-get","update"], check=True)
-
-    to_install = []
-    for pkg in pkgs:
-        print(f"→ Resolving {pkg}")
+    # 3) Refresh once, unless the lists are still fresh. pkgcache.bin is no
+    #    guide: any apt call rebuilds it after the dpkg status changes. An
+    #    update that finds nothing new leaves the lists directory alone, so
+    #    successful updates run from here are also recorded in a stamp.
+    stamp_path = _cache_dir() / "apt_updated"
+    updated = 0.0
+    for path in (_APT_LISTS, stamp_path):
+        try:
+            updated = max(updated, os.path.getmtime(path))
+        except OSError:
+            pass
+    age = time.time() - updated
+    # The in-process cache needs root both to update and to install
+    is_root = os.geteuid() == 0
+    cache = apt.Cache() if apt is not None and is_root else None
+    # Never stop on a debconf prompt. sudo keeps the variable only where the
+    # sudoers policy allows it: setting it on sudo's command line would be
+    # refused by rules limited to apt-get, so it is just passed along.
+    # -n fails at once instead of waiting for a password nobody can type
+    # when there is no terminal.
+    env = {**os.environ, "DEBIAN_FRONTEND": "noninteractive"}
+    if is_root:
+        apt_get = ["apt-get"]
+    else:
+        interactive = sys.stdin is not None and sys.stdin.isatty()
+        apt_get = ["sudo", *(() if interactive else ("-n",)), "apt-get"]
+    if force_update or age > _APT_UPDATE_TTL:
+        if cache is not None:
+            with _noninteractive_env():
+                cache.update(apt.progress.text.AcquireProgress())
+            cache.open()
+        else:
+            subprocess.run([*apt_get,"-q","update"], check=True, env=env)
+        try:
+            stamp_path.parent.mkdir(parents=True, exist_ok=True)
+            stamp_path.touch()
+        except OSError:
+            pass
+    else:
+        print(f"Package lists are {int(age // 60)} min old, skipping apt-get update.")
 
-        # a) real package?
-        show = subprocess.run(
-            ["apt-cache","show",pkg],
+    # 4) Classify every name with one cache lookup instead of letting a full
+    #    apt-get dependency solve fail on it. Names are keyed as showpkg
+    #    prints them, so "foolib:i386" and "foolib" stay apart. Names
+    #    classified by an earlier run against the same lists are reused.
+    try:
+        state = f"{os.stat(_APT_LISTS).st_mtime_ns}:{os.stat(_DPKG_STATUS).st_mtime_ns}"
+    except OSError:
+        state = None
+    resolved_path = _apt_resolved_path()
+    # name -> [has versions, first provider or None, known to apt]
+    resolved: dict[str, list] = {}
+    if state is not None:
+        try:
+            saved = json.loads(resolved_path.read_text())
+            if saved["state"] == state:
+                resolved = saved["names"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+    names = dict.fromkeys(name for pkg, alternates in deps for name in (pkg, *alternates))
+    native = None
+    if any(name.partition(":")[2] not in _ARCH_BARE for name in names):
+        # Only a name qualified with an architecture needs the native one
+        if cache is not None:
+            native = apt.apt_pkg.config.find("APT::Architecture")
+        else:
+            native = subprocess.run(
+                ["dpkg","--print-architecture"],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+            ).stdout.strip()
+    keys = {name: _showpkg_name(name, native) for name in names}
+    pkgs = [pkg for pkg in names if keys[pkg] not in resolved]
+    known: set[str] = set()
+    real: set[str] = set()
+    providers: dict[str, str] = {}
+    if pkgs and cache is not None:
+        for pkg in pkgs:
+            key = keys[pkg]
+            if key in cache:
+                real.add(key)
+            elif provided_by := cache.get_providing_packages(key):
+                providers[key] = provided_by[0].name
+            # Mentioned somewhere in the lists, even with nothing to install
+            if key in cache._cache:
+                known.add(key)
+    elif pkgs:
+        showpkg_out = subprocess.run(
+            ["apt-cache","showpkg",*pkgs],
             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
-        )
-        if show.stdout:
+        ).stdout
+        known, real, providers = _parse_showpkg(showpkg_out)
+
+    if pkgs:
+        for pkg in pkgs:
+            key = keys[pkg]
+            resolved[key] = [key in real, providers.get(key), key in known]
+        if state is not None:
+            try:
+                resolved_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = resolved_path.with_name(f"{resolved_path.name}.{os.getpid()}.tmp")
+                tmp_path.write_text(json.dumps({"state": state, "names": resolved}))
+                # Atomic: a concurrent run sees either the old file or the new one
+                os.replace(tmp_path, resolved_path)
+            except OSError:
+                pass
+    real = {name for name, (is_real, _, _) in resolved.items() if is_real}
+    providers = {name: provider for name, (_, provider, _) in resolved.items() if provider}
+    known = {name for name, (_, _, is_known) in resolved.items() if is_known}
+
+    to_install = []
+    for pkg, alternates in deps:
+        if keys[pkg] in real:
             to_install.append(pkg)
             continue
-
-        # b) virtual → parse Reverse Provides block
-        sp = subprocess.run(
-            ["apt-cache","showpkg",pkg],
-            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
-        )
-        provider = None
-        in_rev = False
-        for line in sp.stdout.splitlines():
-            stripped = line.strip()
-            if not in_rev:
-                if stripped == "Reverse Provides:":
-                    in_rev = True
-                continue
-            # once in_rev: skip blank lines, take the first non-blank as provider
-            if stripped:
-                provider = stripped.split()[0]
-                print(f"    ↳ Virtual {pkg} → {provider}")
+        print(f"→ Resolving {pkg}")
+        for candidate in (pkg, *alternates):
+            key = keys[candidate]
+            if key in real:
+                print(f"    ↳ Alternate {pkg} → {candidate}")
+                to_install.append(candidate)
+                break
+            if provider := providers.get(key):
+                print(f"    ↳ Virtual {candidate} → {provider}")
+                to_install.append(provider)
                 break
-            # blank line ends the block
-            break
-
-        if provider:
-            to_install.append(provider)
         else:
-            print(f"    ⚠️  Skipping {pkg}: no provider found")
+            if any(keys[c] in known for c in (pkg, *alternates)):
+                print(f"    ⚠️  Skipping {pkg}: no provider found")
+            else:
+                print(f"    ⚠️  Skipping {pkg}: unknown package")
 
     if not to_install:
         print("Nothing to install.")
         return
 
-    # 4) Install all at once
+    # 5) Install everything in one go
     print("Installing:", ", ".join(to_install))
-    subprocess.run(
-        ["sudo","apt-get","install","-y", *to_install],
-        check=True
-    )
+    if cache is not None:
+        with cache.actiongroup():
+            for pkg in to_install:
+                cache[pkg].mark_install()
+        with _noninteractive_env():
+            cache.commit(apt.progress.text.AcquireProgress(), apt.progress.base.InstallProgress())
+    else:
+        subprocess.run(
+            [*apt_get,"install","-y", *to_install],
+            check=True, env=env
+        )
     print("Done.")
 
+
+async def install_deb_deps_async(deps_file: str | Path, force_update: bool = False) -> None:
+    """
+    Awaitable form of `install_deb_deps`, run on the default executor so the
+    event loop keeps serving other tasks meanwhile. apt holds a system-wide
+    lock, so concurrent calls still install one after the other.
+    """
+    await asyncio.to_thread(install_deb_deps, deps_file, force_update)
+
 if __name__ == "__main__":
     install_deb_deps("chrome-headless-shell-linux64/deb.deps")
@@ -0,0 +1,337 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from soaresmodules import soares_utils
+from soaresmodules.soares_utils import _ALT_RE, _DEP_RE, _parse_showpkg, _showpkg_name, install_deb_deps
+
+
+def _parse(text: str) -> list[tuple[str, list[str]]]:
+    return [(pkg, _ALT_RE.findall(rest)) for pkg, rest in _DEP_RE.findall(text)]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("curl\n", [("curl", [])]),
+        ("  curl  \n\twget\n", [("curl", []), ("wget", [])]),
+        ("", []),
+        ("\n\n   \n", []),
+        # comments
+        ("# curl\n", []),
+        ("   # curl\n", []),
+        ("curl # needed by setup\n", [("curl", [])]),
+        ("curl# needed by setup\n", [("curl", [])]),
+        ("curl | wget # | aria2\n", [("curl", ["wget"])]),
+        # version constraints
+        ("libssl-dev (>= 3.0)\n", [("libssl-dev", [])]),
+        ("libssl-dev(>= 3.0)\n", [("libssl-dev", [])]),
+        ("python3 (>= 3.10) | python3.12 (<< 4)\n", [("python3", ["python3.12"])]),
+        # alternates
+        ("default-mta | mail-transport-agent\n", [("default-mta", ["mail-transport-agent"])]),
+        ("a|b|c\n", [("a", ["b", "c"])]),
+        ("a |  b  |\tc\n", [("a", ["b", "c"])]),
+        # architecture qualifiers are kept
+        ("libc6:i386\n", [("libc6:i386", [])]),
+        ("gcc:amd64 (>= 12) | clang:any\n", [("gcc:amd64", ["clang:any"])]),
+        # CRLF line endings
+        ("curl\r\nwget (>= 1)\r\n", [("curl", []), ("wget", [])]),
+        ("a | b\r\n# c\r\n\r\nd\r\n", [("a", ["b"]), ("d", [])]),
+        # last line without a newline
+        ("curl\nwget", [("curl", []), ("wget", [])]),
+    ],
+)
+def test_deps_lines(text, expected):
+    assert _parse(text) == expected
+
+
+_SHOWPKG_REAL = """\
+Package: bash
+Versions:
+5.2.15-2+b9 (/var/lib/apt/lists/deb.debian.org_debian_dists_bookworm_main_binary-amd64_Packages) (/var/lib/dpkg/status)
+ Description Language:
+                 File: /var/lib/apt/lists/deb.debian.org_debian_dists_bookworm_main_binary-amd64_Packages
+                  MD5: 3522aa7b4374048d6450e348a5bb45d9
+
+
+Reverse Depends:
+  bash-completion,bash 1:2.1
+  apparmor,bash 4.1
+Dependencies:
+5.2.15-2+b9 - libc6 (2 2.36) libtinfo6 (2 6) base-files (2 2.1.12) debianutils (2 5.6-0.1)
+Provides:
+5.2.15-2+b9 -
+Reverse Provides:
+"""
+
+_SHOWPKG_VIRTUAL = """\
+Package: mail-transport-agent
+Versions:
+
+Reverse Depends:
+  mailutils,mail-transport-agent
+  bsd-mailx,mail-transport-agent
+Dependencies:
+Provides:
+Reverse Provides:
+postfix 3.7.11-0+deb12u1 (= )
+exim4-daemon-light 4.96-15+deb12u6 (= )
+"""
+
+# Mentioned by another package's Depends but neither built nor provided
+_SHOWPKG_NO_PROVIDER = """\
+Package: libfoo-removed
+Versions:
+
+Reverse Depends:
+  libbar,libfoo-removed
+Dependencies:
+Provides:
+Reverse Provides:
+"""
+
+
+# A foreign architecture keeps its qualifier
+_SHOWPKG_FOREIGN = """\
+Package: foolib:i386
+Versions:
+1.2-3 (/var/lib/apt/lists/deb.debian.org_debian_dists_bookworm_main_binary-i386_Packages)
+ Description Language:
+                 File: /var/lib/apt/lists/deb.debian.org_debian_dists_bookworm_main_binary-i386_Packages
+                  MD5: 0f1e2d3c4b5a69788796a5b4c3d2e1f0
+
+
+Reverse Depends:
+Dependencies:
+1.2-3 - libc6:i386 (2 2.36)
+Provides:
+1.2-3 -
+Reverse Provides:
+"""
+
+
+@pytest.mark.parametrize(
+    "text, known, real, providers",
+    [
+        (_SHOWPKG_REAL, {"bash"}, {"bash"}, {}),
+        (_SHOWPKG_FOREIGN, {"foolib:i386"}, {"foolib:i386"}, {}),
+        (_SHOWPKG_VIRTUAL, {"mail-transport-agent"}, set(), {"mail-transport-agent": "postfix"}),
+        (_SHOWPKG_NO_PROVIDER, {"libfoo-removed"}, set(), {}),
+        # Unknown names only produce a notice on stderr
+        ("", set(), set(), {}),
+        (
+            _SHOWPKG_REAL + _SHOWPKG_VIRTUAL + _SHOWPKG_NO_PROVIDER,
+            {"bash", "mail-transport-agent", "libfoo-removed"},
+            {"bash"},
+            {"mail-transport-agent": "postfix"},
+        ),
+        (
+            _SHOWPKG_VIRTUAL + _SHOWPKG_REAL,
+            {"bash", "mail-transport-agent"},
+            {"bash"},
+            {"mail-transport-agent": "postfix"},
+        ),
+    ],
+)
+def test_parse_showpkg(text, known, real, providers):
+    assert _parse_showpkg(text) == (known, real, providers)
+
+
+@pytest.mark.parametrize(
+    "pkg, expected",
+    [
+        ("bash", "bash"),
+        ("bash:amd64", "bash"),
+        ("bash:any", "bash"),
+        ("bash:all", "bash"),
+        ("bash:native", "bash"),
+        ("foolib:i386", "foolib:i386"),
+        ("foolib:arm64", "foolib:arm64"),
+    ],
+)
+def test_showpkg_name(pkg, expected):
+    assert _showpkg_name(pkg, "amd64") == expected
+
+
+# ---------------------------------------------------------------------------
+# install_deb_deps with apt-get and apt-cache stubbed out
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def apt_env(tmp_path, monkeypatch):
+    """
+    Point install_deb_deps at fresh lists and dpkg status under `tmp_path`
+    and record every command it runs. `apt-cache showpkg` answers from
+    `env.showpkg`, keyed by the name asked for.
+    """
+    lists = tmp_path / "lists"
+    lists.mkdir()
+    status = tmp_path / "status"
+    status.write_text("")
+    monkeypatch.setattr(soares_utils, "_APT_LISTS", str(lists))
+    monkeypatch.setattr(soares_utils, "_DPKG_STATUS", str(status))
+    monkeypatch.setattr(soares_utils, "apt", None)
+    monkeypatch.setattr(os, "geteuid", lambda: 1000)
+    monkeypatch.setattr(sys, "stdin", io.StringIO())
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    env = SimpleNamespace(calls=[], showpkg={}, lists=lists, status=status, deps=tmp_path / "deb.deps")
+
+    def run(args, **kwargs):
+        env.calls.append(list(args))
+        stdout = ""
+        if args[:2] == ["apt-cache", "showpkg"]:
+            stdout = "".join(env.showpkg.get(name, "") for name in args[2:])
+        elif args == ["dpkg", "--print-architecture"]:
+            stdout = "amd64\n"
+        return subprocess.CompletedProcess(args, 0, stdout=stdout)
+
+    monkeypatch.setattr(subprocess, "run", run)
+    return env
+
+
+def _install(env, text: str, **kwargs) -> None:
+    env.deps.write_text(text)
+    install_deb_deps(env.deps, **kwargs)
+
+
+def _age(path, seconds: float) -> None:
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def _updates(env) -> list[list[str]]:
+    return [call for call in env.calls if call[-1] == "update"]
+
+
+def test_fresh_lists_skip_update(apt_env):
+    _install(apt_env, "bash\n")
+    assert _updates(apt_env) == []
+
+
+def test_stale_lists_update_once(apt_env):
+    _age(apt_env.lists, 7200)
+    _install(apt_env, "bash\n")
+    assert len(_updates(apt_env)) == 1
+    # Nothing new on the mirror leaves the lists alone: the stamp is fresh
+    _age(apt_env.lists, 7200)
+    _install(apt_env, "bash\n")
+    assert len(_updates(apt_env)) == 1
+
+
+def test_force_update(apt_env):
+    _install(apt_env, "bash\n", force_update=True)
+    assert len(_updates(apt_env)) == 1
+
+
+
+class _Tty(io.StringIO):
+    def isatty(self) -> bool:
+        return True
+
+
+@pytest.mark.parametrize(
+    "euid, stdin, prefix",
+    [
+        (0, io.StringIO(), ["apt-get"]),
+        (1000, _Tty(), ["sudo", "apt-get"]),
+        (1000, io.StringIO(), ["sudo", "-n", "apt-get"]),
+        # fd 0 closed, as under some daemons
+        (1000, None, ["sudo", "-n", "apt-get"]),
+    ],
+)
+def test_apt_get_prefix(apt_env, monkeypatch, euid, stdin, prefix):
+    monkeypatch.setattr(os, "geteuid", lambda: euid)
+    monkeypatch.setattr(sys, "stdin", stdin)
+    apt_env.showpkg["bash"] = _SHOWPKG_REAL
+    _install(apt_env, "bash\n", force_update=True)
+    assert apt_env.calls[0] == [*prefix, "-q", "update"]
+    assert apt_env.calls[-1] == [*prefix, "install", "-y", "bash"]
+
+
+def test_foreign_architecture(apt_env):
+    apt_env.showpkg["foolib:i386"] = _SHOWPKG_FOREIGN
+    apt_env.showpkg["bash:amd64"] = _SHOWPKG_REAL
+    _install(apt_env, "foolib:i386\nbash:amd64\n")
+    assert apt_env.calls[-1] == ["sudo", "-n", "apt-get", "install", "-y", "foolib:i386", "bash:amd64"]
+    names = json.loads(soares_utils._apt_resolved_path().read_text())["names"]
+    assert names == {"foolib:i386": [True, None, True], "bash": [True, None, True]}
+    # The native foolib is a different package, unknown here
+    _install(apt_env, "foolib\n")
+    assert apt_env.calls[-1][:2] == ["apt-cache", "showpkg"]
+    assert apt_env.calls[-1][2:] == ["foolib"]
+
+
+def _showpkg_calls(env) -> list[list[str]]:
+    return [call[2:] for call in env.calls if call[:2] == ["apt-cache", "showpkg"]]
+
+
+def test_empty_deps_file(apt_env, capsys):
+    _install(apt_env, "# nothing yet\n\n")
+    assert "No packages to install." in capsys.readouterr().out
+    assert apt_env.calls == []
+
+
+def test_resolution(apt_env, capsys):
+    apt_env.showpkg["bash"] = _SHOWPKG_REAL
+    apt_env.showpkg["mail-transport-agent"] = _SHOWPKG_VIRTUAL
+    apt_env.showpkg["libfoo-removed"] = _SHOWPKG_NO_PROVIDER
+    _install(apt_env, (
+        "bash\n"
+        "mail-transport-agent\n"
+        "missing | bash\n"
+        "missing | mail-transport-agent (>= 1)\n"
+        "libfoo-removed | missing\n"
+        "missing | gone\n"
+    ))
+    out = capsys.readouterr().out
+    # One lookup for every distinct name
+    assert _showpkg_calls(apt_env) == [["bash", "mail-transport-agent", "missing", "libfoo-removed", "gone"]]
+    assert "Virtual mail-transport-agent → postfix" in out
+    assert "Alternate missing → bash" in out
+    assert "Skipping libfoo-removed: no provider found" in out
+    assert "Skipping missing: unknown package" in out
+    assert apt_env.calls[-1] == ["sudo", "-n", "apt-get", "install", "-y", "bash", "postfix", "bash", "postfix"]
+
+
+def test_nothing_to_install(apt_env, capsys):
+    _install(apt_env, "missing\n")
+    assert "Nothing to install." in capsys.readouterr().out
+    assert [call[:2] for call in apt_env.calls] == [["apt-cache", "showpkg"]]
+
+
+def test_classification_cache(apt_env):
+    apt_env.showpkg["bash"] = _SHOWPKG_REAL
+    apt_env.showpkg["mail-transport-agent"] = _SHOWPKG_VIRTUAL
+    _install(apt_env, "bash\nmail-transport-agent\n")
+    names = json.loads(soares_utils._apt_resolved_path().read_text())["names"]
+    assert names == {"bash": [True, None, True], "mail-transport-agent": [False, "postfix", True]}
+    # Same lists and dpkg status: only the new name is looked up
+    _install(apt_env, "bash\nmail-transport-agent\nmissing\n")
+    assert _showpkg_calls(apt_env) == [["bash", "mail-transport-agent"], ["missing"]]
+    assert apt_env.calls[-1][-2:] == ["bash", "postfix"]
+    # A dpkg status change invalidates every entry
+    _age(apt_env.status, 60)
+    _install(apt_env, "bash\n")
+    assert _showpkg_calls(apt_env)[-1] == ["bash"]
+    # and so do new lists
+    _install(apt_env, "bash\n")
+    assert len(_showpkg_calls(apt_env)) == 3
+    _age(apt_env.lists, 60)
+    _install(apt_env, "bash\n")
+    assert len(_showpkg_calls(apt_env)) == 4
+
+
+def test_classification_cache_unreadable(apt_env):
+    apt_env.showpkg["bash"] = _SHOWPKG_REAL
+    path = soares_utils._apt_resolved_path()
+    path.parent.mkdir(parents=True)
+    path.write_text("{not json")
+    _install(apt_env, "bash\n")
+    assert apt_env.calls[-1][-1] == "bash"
+    assert json.loads(path.read_text())["names"] == {"bash": [True, None, True]}
@@ -0,0 +1,157 @@
+import os
+
+import pytest
+
+from soaresmodules import ensure_paths, soares_utils
+from soaresmodules.soares_utils import _access_bits
+
+_ALL = os.R_OK | os.W_OK | os.X_OK
+_is_root = hasattr(os, "geteuid") and os.geteuid() == 0
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    ensure_paths.clear_cache()
+    yield
+    ensure_paths.clear_cache()
+
+
+def test_cached_success_is_not_rechecked(tmp_path):
+    d = tmp_path / "d"
+    d.mkdir()
+    assert ensure_paths([d]) is False
+    d.rmdir()
+    assert ensure_paths([d]) is False
+
+
+def test_clear_cache(tmp_path):
+    d = tmp_path / "d"
+    d.mkdir()
+    assert ensure_paths([d]) is False
+    d.rmdir()
+    ensure_paths.clear_cache()
+    assert "Directory does not exist" in ensure_paths([d])
+
+
+def test_failure_is_not_cached(tmp_path):
+    d = tmp_path / "d"
+    assert ensure_paths([d])
+    d.mkdir()
+    assert ensure_paths([d]) is False
+
+
+def test_create_always_runs(tmp_path):
+    d = tmp_path / "d"
+    f = tmp_path / "f.sh"
+    f.touch(0o755)
+    assert ensure_paths([d], [f], create_dir=True, create_file=True) is False
+    f.unlink()
+    d.rmdir()
+    # The recreated file is not executable, but it is there again
+    assert "File is not executable" in ensure_paths([d], [f], create_dir=True, create_file=True)
+    assert d.is_dir()
+    assert f.is_file()
+
+
+def test_relative_paths_keyed_by_cwd(tmp_path, monkeypatch):
+    (tmp_path / "a" / "sub").mkdir(parents=True)
+    (tmp_path / "b").mkdir()
+    monkeypatch.chdir(tmp_path / "a")
+    assert ensure_paths(["sub"]) is False
+    monkeypatch.chdir(tmp_path / "b")
+    assert "Directory does not exist: sub" in ensure_paths(["sub"])
+
+
+def test_missing_without_create(tmp_path):
+    d = tmp_path / "d"
+    f = tmp_path / "sub" / "f.sh"
+    g = tmp_path / "g.sh"
+    assert ensure_paths([d], [f, g]).splitlines() == [
+        f"Directory does not exist: {d}. Create it or set create_dir=True.",
+        f"Parent directory does not exist: {f.parent}. Create it or set create_file=True.",
+        f"File does not exist: {g}. Create it or set create_file=True.",
+    ]
+    assert not d.exists() and not f.parent.exists() and not g.exists()
+
+
+def test_create_on_missing(tmp_path):
+    d = tmp_path / "a" / "b"
+    f = tmp_path / "x" / "y" / "f.sh"
+    errors = ensure_paths([d], [f], create_dir=True, create_file=True)
+    assert d.is_dir()
+    assert f.is_file() and f.stat().st_size == 0
+    # A fresh file is not executable
+    assert errors == f"File is not executable: {f}. Set execute permission: chmod +x '{f}'"
+
+
+def test_existing_paths_pass(tmp_path):
+    f = tmp_path / "run.sh"
+    f.touch(0o755)
+    assert ensure_paths([tmp_path], [f]) is False
+    assert ensure_paths([str(tmp_path)], [str(f)]) is False
+
+
+@pytest.mark.skipif(_is_root, reason="root bypasses permission bits")
+def test_permission_errors_in_order(tmp_path):
+    d = tmp_path / "ro"
+    d.mkdir(0o500)
+    f = tmp_path / "f"
+    f.touch(0o200)
+    try:
+        assert ensure_paths([d], [f]).splitlines() == [
+            f"Directory is not writable: {d}. Set write permission: chmod +w '{d}'",
+            f"File is not readable: {f}. Set read permission: chmod +r '{f}'",
+            f"File is not executable: {f}. Set execute permission: chmod +x '{f}'",
+        ]
+    finally:
+        d.chmod(0o700)
+
+
+@pytest.mark.parametrize("count", [3, soares_utils._ENSURE_PATHS_PARALLEL_MIN + 8])
+def test_errors_keep_input_order(tmp_path, count):
+    # Every other path is missing; long lists go through the thread pool
+    dirs = [tmp_path / f"d{i}" for i in range(count)]
+    files = [tmp_path / f"f{i}.sh" for i in range(count)]
+    for i in range(0, count, 2):
+        dirs[i].mkdir()
+        files[i].touch(0o755)
+    expected = [f"Directory does not exist: {d}. Create it or set create_dir=True." for d in dirs[1::2]]
+    expected += [f"File does not exist: {f}. Create it or set create_file=True." for f in files[1::2]]
+    assert ensure_paths(dirs, files).splitlines() == expected
+
+
+def test_parent_checked_once(tmp_path, monkeypatch):
+    created = []
+    ensure_dir = soares_utils._ensure_dir
+    monkeypatch.setattr(soares_utils, "_ensure_dir", lambda p: (created.append(p), ensure_dir(p)))
+    files = [tmp_path / "a" / f"f{i}" for i in range(5)] + [tmp_path / "b" / f"f{i}" for i in range(5)]
+    ensure_paths(file_paths=files, create_file=True)
+    assert sorted(created) == [tmp_path / "a", tmp_path / "b"]
+    assert all(f.is_file() for f in files)
+
+
+def test_invalid_entry_is_reported(tmp_path):
+    assert "Error handling directory 'None'" in ensure_paths([None])
+    # and not cached
+    assert "Error handling directory 'None'" in ensure_paths([None])
+
+
+def test_access_bits(tmp_path):
+    f = tmp_path / "f"
+    f.touch(0o755)
+    assert _access_bits(f, _ALL) == _ALL
+    assert _access_bits(f, os.R_OK | os.W_OK) == os.R_OK | os.W_OK
+    f.chmod(0o644)
+    assert _access_bits(f, _ALL) == os.R_OK | os.W_OK
+    assert _access_bits(tmp_path / "missing", _ALL) is None
+    # A file used as a directory
+    assert _access_bits(f / "child", _ALL) is None
+
+
+@pytest.mark.skipif(_is_root, reason="root bypasses permission bits")
+def test_access_bits_read_only(tmp_path):
+    f = tmp_path / "f"
+    f.touch(0o444)
+    assert _access_bits(f, _ALL) == os.R_OK
+    f.chmod(0)
+    assert _access_bits(f, _ALL) == 0
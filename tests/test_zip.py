@@ -0,0 +1,305 @@
+import hashlib
+import http.server
+import io
+import os
+import random
+import threading
+import urllib.error
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from soaresmodules import soares_utils
+from soaresmodules.soares_utils import _central_directory_start, _member_target, download_and_extract_zip
+
+
+def _members() -> dict[str, bytes]:
+    rng = random.Random(0)
+    members = {}
+    for i in range(24):
+        if i % 3 == 0:
+            data = rng.randbytes(rng.randrange(1, 600_000))
+        else:
+            data = f"line {i}\n".encode() * rng.randrange(0, 40_000)
+        members[f"d{i % 4}/sub{i % 2}/f{i}.bin"] = data
+    members["top.txt"] = b"top\n"
+    return members
+
+
+def _zip_bytes(members: dict[str, bytes], comment: bytes = b"", directories: tuple[str, ...] = ()) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name in directories:
+            zf.mkdir(name)
+        for name, data in members.items():
+            zf.writestr(name, data)
+        zf.comment = comment
+    return buf.getvalue()
+
+
+def _tree(root: Path) -> dict[str, bytes]:
+    skip = (".zip", ".part", ".etag")
+    return {
+        p.relative_to(root).as_posix(): p.read_bytes()
+        for p in root.rglob("*")
+        if p.is_file() and not p.name.endswith(skip)
+    }
+
+
+# ---------------------------------------------------------------------------
+# _central_directory_start
+# ---------------------------------------------------------------------------
+
+@pytest.fixture(params=["plain", "comment", "zip64", "zip64+comment"])
+def archive(request, monkeypatch) -> bytes:
+    if request.param.startswith("zip64"):
+        # Small enough that this archive needs the ZIP64 end record and locator
+        monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 1 << 10)
+        monkeypatch.setattr(zipfile, "ZIP_FILECOUNT_LIMIT", 4)
+    comment = b"built for tests \x00 PK" * 20 if request.param.endswith("comment") else b""
+    data = _zip_bytes({f"m{i}.txt": b"x" * 4000 for i in range(8)}, comment)
+    assert (b"PK\x06\x07" in data[-(22 + len(comment) + 20):]) == request.param.startswith("zip64")
+    return data
+
+
+def test_central_directory_start(archive):
+    expected = zipfile.ZipFile(io.BytesIO(archive)).start_dir
+    assert _central_directory_start(archive, 0) == expected
+    # As seen from a tail fetched by a Range request
+    for tail_lo in (expected, expected // 2, max(0, len(archive) - 4096)):
+        if tail_lo <= expected:
+            assert _central_directory_start(archive[tail_lo:], tail_lo) == expected
+
+
+def test_central_directory_start_not_a_zip():
+    assert _central_directory_start(b"no end record here" * 10, 0) is None
+    assert _central_directory_start(b"", 0) is None
+
+
+# ---------------------------------------------------------------------------
+# _member_target
+# ---------------------------------------------------------------------------
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "plain.txt",
+        "a/b/c.txt",
+        "../x",
+        "../../etc/passwd",
+        "/abs/y",
+        "//double/z",
+        "a/../../b",
+        "./c",
+        "a/./b/../c",
+        "a//b",
+        "dir/",
+    ],
+)
+def test_member_target_matches_extract(tmp_path, name):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr(name, b"" if name.endswith("/") else b"data")
+    with zipfile.ZipFile(buf) as zf:
+        info = zf.infolist()[0]
+        expected = Path(zf.extract(info, tmp_path))
+    target = _member_target(info, tmp_path)
+    assert target == expected
+    assert target.is_relative_to(tmp_path)
+
+
+# ---------------------------------------------------------------------------
+# download_and_extract_zip against a local server
+# ---------------------------------------------------------------------------
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves `files` with ETag, single Range, If-Range, If-None-Match and 416
+    support, recording (method, path, Range header, status) in `log`.
+    """
+    protocol_version = "HTTP/1.1"
+    files: dict[str, bytes]
+    log: list[tuple[str, str, str | None, int]]
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_HEAD(self) -> None:
+        self._respond()
+
+    def do_GET(self) -> None:
+        self._respond()
+
+    def _send(self, status: int, headers: dict[str, str], body: bytes = b"") -> None:
+        self.log.append((self.command, self.path, self.headers.get("Range"), status))
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command == "GET":
+            self.wfile.write(body)
+
+    def _respond(self) -> None:
+        data = self.files.get(self.path.partition("?")[0])
+        if data is None:
+            return self._send(404, {})
+        etag = '"%s"' % hashlib.md5(data).hexdigest()
+        headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, headers)
+        spec = self.headers.get("Range")
+        if spec and self.headers.get("If-Range", etag) == etag:
+            lo, _, hi = spec.removeprefix("bytes=").partition("-")
+            lo, hi = int(lo), min(int(hi), len(data) - 1) if hi else len(data) - 1
+            if lo >= len(data):
+                return self._send(416, {"Content-Range": f"bytes */{len(data)}"})
+            headers["Content-Range"] = f"bytes {lo}-{hi}/{len(data)}"
+            return self._send(206, headers, data[lo:hi + 1])
+        return self._send(200, headers, data)
+
+
+@pytest.fixture
+def server():
+    handler = type("Handler", (_Handler,), {"files": {}, "log": []})
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    handler.base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield handler
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def served(server):
+    members = _members()
+    data = _zip_bytes(members, directories=("empty",))
+    server.files["/archive.zip"] = data
+    return server, f"{server.base}/archive.zip?sig=abc", data, members
+
+
+@pytest.mark.parametrize("parallel", [1, 4])
+@pytest.mark.parametrize("tail_size", [1 << 20, 4096])
+def test_pipelined(served, tmp_path, monkeypatch, capsys, parallel, tail_size):
+    server, url, data, members = served
+    monkeypatch.setattr(soares_utils, "_TAIL_SIZE", tail_size)
+    monkeypatch.setattr(soares_utils, "_PARALLEL_MIN_SIZE", 0)
+    monkeypatch.setattr(soares_utils, "_RANGE_MIN_SIZE", 256 << 10)
+    download_and_extract_zip(url, tmp_path, delete_zip=False, parallel=parallel)
+    assert "while downloading" in capsys.readouterr().out
+    assert _tree(tmp_path) == members
+    assert (tmp_path / "empty").is_dir()
+    assert (tmp_path / "archive.zip").read_bytes() == data
+    assert not (tmp_path / "archive.zip.part").exists()
+    ranges = [r for method, _, r, status in server.log if method == "GET" and status == 206]
+    assert len(ranges) >= (3 if parallel > 1 else 2)
+
+
+def test_pipelined_selected_members(served, tmp_path, capsys):
+    server, url, data, members = served
+    wanted = ["d1/sub1/f1.bin", "d3/sub1/f7.bin", "top.txt"]
+    download_and_extract_zip(url, tmp_path, members=wanted)
+    assert "selected members" in capsys.readouterr().out
+    assert _tree(tmp_path) == {name: members[name] for name in wanted}
+    fetched = sum(
+        len(data[int(lo):int(hi) + 1])
+        for method, _, spec, status in server.log if method == "GET" and status == 206
+        for lo, hi in [spec.removeprefix("bytes=").split("-")]
+    )
+    assert fetched < len(data)
+
+
+def test_pipelined_unknown_member(served, tmp_path, capsys):
+    server, url, data, members = served
+    with pytest.raises(KeyError):
+        download_and_extract_zip(url, tmp_path, members=["nope"])
+    assert list(tmp_path.iterdir()) == []
+    # The progress dots of the tail fetch are terminated
+    out = capsys.readouterr().out
+    assert "." in out and out.endswith("\n")
+
+
+def test_spooled(served, tmp_path):
+    server, url, data, members = served
+    download_and_extract_zip(url, tmp_path)
+    assert _tree(tmp_path) == members
+    # Never written to the destination, not even as a partial file
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_file()) == ["top.txt"]
+    assert [status for method, _, _, status in server.log if method == "GET"] == [200]
+
+
+def test_spooled_clears_stale_partial(served, tmp_path):
+    server, url, data, members = served
+    (tmp_path / "archive.zip.part").write_bytes(b"stale" * 1000)
+    (tmp_path / "archive.zip.etag").write_text('"old"')
+    download_and_extract_zip(url, tmp_path)
+    assert _tree(tmp_path) == members
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_file()) == ["top.txt"]
+    # Nothing is left to resume, so the next call takes the pipelined path
+    server.log.clear()
+    download_and_extract_zip(url, tmp_path, delete_zip=False)
+    assert server.log[0][0] == "HEAD"
+
+
+def test_spooled_replaces_changed_archive(served, tmp_path):
+    server, url, data, members = served
+    download_and_extract_zip(url, tmp_path, unzip=False, delete_zip=False)
+    changed = {**members, "top.txt": b"changed\n"}
+    server.files["/archive.zip"] = _zip_bytes(changed)
+    download_and_extract_zip(url, tmp_path)
+    assert _tree(tmp_path) == changed
+    assert not (tmp_path / "archive.zip").exists()
+    assert not (tmp_path / "archive.zip.etag").exists()
+
+
+def test_resume_partial(served, tmp_path, capsys):
+    server, url, data, members = served
+    etag = '"%s"' % hashlib.md5(data).hexdigest()
+    (tmp_path / "archive.zip.part").write_bytes(data[:len(data) // 3])
+    (tmp_path / "archive.zip.etag").write_text(etag)
+    download_and_extract_zip(url, tmp_path, delete_zip=False)
+    assert f"Resuming at byte {len(data) // 3}" in capsys.readouterr().out
+    assert _tree(tmp_path) == members
+    assert (tmp_path / "archive.zip").read_bytes() == data
+    assert server.log[-1] == ("GET", "/archive.zip?sig=abc", f"bytes={len(data) // 3}-", 206)
+
+
+def test_resume_changed_archive_restarts(served, tmp_path):
+    server, url, data, members = served
+    (tmp_path / "archive.zip.part").write_bytes(b"stale" * 1000)
+    (tmp_path / "archive.zip.etag").write_text('"old"')
+    download_and_extract_zip(url, tmp_path, delete_zip=False)
+    assert _tree(tmp_path) == members
+    assert (tmp_path / "archive.zip").read_bytes() == data
+
+
+def test_resume_complete_partial(served, tmp_path):
+    server, url, data, members = served
+    etag = '"%s"' % hashlib.md5(data).hexdigest()
+    (tmp_path / "archive.zip.part").write_bytes(data)
+    (tmp_path / "archive.zip.etag").write_text(etag)
+    download_and_extract_zip(url, tmp_path, delete_zip=False)
+    assert _tree(tmp_path) == members
+    assert (tmp_path / "archive.zip").read_bytes() == data
+    assert not (tmp_path / "archive.zip.part").exists()
+    assert server.log[-1][3] == 416
+
+
+def test_not_modified(served, tmp_path, capsys):
+    server, url, data, members = served
+    download_and_extract_zip(url, tmp_path, unzip=False, delete_zip=False)
+    mtime = os.stat(tmp_path / "archive.zip").st_mtime_ns
+    capsys.readouterr()
+    download_and_extract_zip(url, tmp_path, delete_zip=False)
+    assert "Already up to date" in capsys.readouterr().out
+    assert server.log[-1][3] == 304
+    assert os.stat(tmp_path / "archive.zip").st_mtime_ns == mtime
+    assert _tree(tmp_path) == members
+
+
+def test_http_error(server, tmp_path):
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        download_and_extract_zip(f"{server.base}/missing.zip", tmp_path)
+    assert excinfo.value.code == 404